@@ -3,171 +3,383 @@
 # ==============================================================================
 # 必要なPythonライブラリ
 # ==============================================================================
-# pip install requests beautifulsoup4 openai feedparser
+# pip install requests aiohttp lxml openai feedparser numpy tenacity
 # ==============================================================================
 # 環境変数で設定する情報 (GitHub ActionsのSecretsに設定)
 # 1. OPENAI_API_KEY: OpenAIのAPIキー
 # 2. LINE_CHANNEL_ACCESS_TOKEN: LINE Messaging APIのチャネルアクセストークン
 # 3. LINE_USER_ID: メッセージを送信したいLINEユーザーのID
-# 4. YAHOO_RSS_URL: 取得したいYahoo!ニュースのRSSフィードURL
+# 4. YAHOO_RSS_URL: 取得したいYahoo!ニュースのRSSフィードURL（カンマ区切りで複数指定可）
 # ==============================================================================
 
 import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
 import requests
+import aiohttp
 import feedparser
-from bs4 import BeautifulSoup
-from openai import OpenAI
+import numpy as np
+from requests.adapters import HTTPAdapter
+from lxml import etree
+from openai import (
+    AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError, InternalServerError, RateLimitError
+)
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
 from datetime import datetime
-import time # 連続API呼び出しを避けるために使用
+from concurrent.futures import ThreadPoolExecutor
 
 # 環境変数からAPIキーなどを取得
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 LINE_CHANNEL_ACCESS_TOKEN = os.environ.get("LINE_CHANNEL_ACCESS_TOKEN")
 LINE_USER_ID = os.environ.get("LINE_USER_ID")
-YAHOO_RSS_URL = os.environ.get("YAHOO_RSS_URL", 'https://news.yahoo.co.jp/rss/topics/top-picks.xml')
+YAHOO_RSS_URL = os.environ.get("YAHOO_RSS_URL") or 'https://news.yahoo.co.jp/rss/topics/top-picks.xml'
+YAHOO_RSS_URLS = [url.strip() for url in YAHOO_RSS_URL.split(",") if url.strip()]
+
+# 要約キャッシュ（SQLite）の保存先と保持期間
+CACHE_DB_PATH = "cache.sqlite"
+CACHE_TTL_DAYS = 30
+
+# 言い回しだけが異なる同一ニュースを見つけるための、タイトル埋め込みモデルと類似度のしきい値
+EMBEDDING_MODEL = "text-embedding-3-small"
+SEMANTIC_CACHE_THRESHOLD = 0.92
+
+# 要約1記事あたりの最大生成トークン数
+MAX_TOKENS_PER_ARTICLE = 450
+
+# GPT APIの入力制限を考慮した、記事本文の最大文字数
+MAX_CHARS = 3000
+
+# 記事ページのHTMLを読み込む上限サイズ（本文3000字を含むのに十分な量）
+MAX_HTML_BYTES = 256 * 1024
+
+# HTTP通信で共通して使うヘッダー
+HTTP_HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; hakoiri-news-bot)"}
+
+# 接続を使い回すための共有セッション（TLSハンドシェイクを毎回行わずに済む）
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(pool_connections=20, pool_maxsize=20))
+SESSION.headers.update(HTTP_HEADERS)
 
 
 # OpenAIクライアントを初期化
 try:
     if OPENAI_API_KEY:
-        openai_client = OpenAI(api_key=OPENAI_API_KEY)
+        # 再試行は下のopenai_retryにまとめるため、SDK側の自動再試行は無効にする
+        openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
     else:
         raise ValueError("OPENAI_API_KEYが設定されていません。")
 except Exception as e:
     print(f"初期化エラー: {e}")
     exit()
 
+def _is_retryable_openai_error(exc):
+    """
+    再試行で回復が見込めるOpenAI APIのエラーかどうかを判定します。
+    （SDKの自動再試行と同じく、429・408・409・5xx・タイムアウト・接続エラーが対象。
+      ただし利用枠の上限（insufficient_quota）による429は待っても回復しないため除外）
+    """
+    if isinstance(exc, RateLimitError):
+        return getattr(exc, 'code', None) != "insufficient_quota"
+    if isinstance(exc, (APITimeoutError, APIConnectionError, InternalServerError)):
+        return True
+    return isinstance(exc, APIStatusError) and exc.status_code in (408, 409)
+
+# 一時的なエラー（レート制限・サーバーエラー・通信エラー）の場合は、待ち時間をランダムに伸ばしながら再試行する
+openai_retry = retry(
+    wait=wait_random_exponential(min=1, max=30),
+    stop=stop_after_attempt(5),
+    retry=retry_if_exception(_is_retryable_openai_error),
+    reraise=True
+)
+
+@openai_retry
+async def create_chat_completion(**kwargs):
+    return await openai_client.chat.completions.create(**kwargs)
+
+@openai_retry
+async def create_embeddings(**kwargs):
+    return await openai_client.embeddings.create(**kwargs)
+
 # ------------------------------------------------------------------------------
-# 関数1: ニュースのRSSフィードを取得し、最新のニュースを複数件取得する (修正点)
+# 関数1: ニュースのRSSフィードを取得し、最新のニュースを複数件取得する (修正点: 複数フィードを並行取得)
 # ------------------------------------------------------------------------------
-def get_latest_news_from_rss(rss_url, count=3):
+def fetch_feed(rss_url, cached):
     """
-    Yahoo!ニュースのRSSフィードから最新のニュース記事を最大count件取得します。
-    戻り値: [{'title': '...', 'url': '...'}, ...] のリスト
+    1つのRSSフィードを取得して解析します。スレッドから呼び出すため、キャッシュDBには触れません。
+    共有セッションで圧縮転送と条件付きGETを使い、更新がなければ前回のフィード(cached)を再利用します。
+    戻り値: (解析済みフィード, 保存すべき (ETag, Last-Modified, 本文)) のタプル
+            （前回から更新がない場合や記事を読み取れなかった場合、保存すべき値はNone。
+              取得に失敗した場合は (None, None)）
     """
-    print(f"RSSフィードを取得中: {rss_url} (最新{count}件)")
+    print(f"RSSフィードを取得中: {rss_url}")
     try:
-        feed = feedparser.parse(rss_url)
-        
+        # 圧縮転送（Accept-Encoding）はrequestsのセッションが既定で要求する
+        headers = {}
+        if cached:
+            etag, last_modified, _ = cached
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        response = SESSION.get(rss_url, headers=headers, timeout=10)
+        if response.status_code == 304 and cached:
+            print(f"RSSフィードに更新がないため、前回取得したフィードを使用します: {rss_url}")
+            return feedparser.parse(cached[2]), None
+
+        response.raise_for_status()
+        content = response.content
+        feed = feedparser.parse(content)
+        # 記事を読み取れなかった応答（エラーページなど）は、次回の304で再利用しないよう保存しない
         if not feed.entries:
-            print("エラー: RSSフィードから記事が見つかりませんでした。")
-            return []
-
-        # 最新の記事から指定件数（count）分を取得
-        news_list = []
-        for entry in feed.entries[:count]:
-            news_list.append({
-                'title': entry.title,
-                'url': entry.link
-            })
-            print(f"記事取得: {entry.title}")
-            
-        return news_list
+            return feed, None
+        validators = (response.headers.get('ETag'), response.headers.get('Last-Modified'), content)
+        return feed, validators
 
     except Exception as e:
-        print(f"RSS取得または解析中にエラーが発生しました: {e}")
+        print(f"RSS取得または解析中にエラーが発生しました: {rss_url}: {e}")
+        return None, None
+
+def get_latest_news_from_rss(rss_urls, cache_conn, count=3):
+    """
+    Yahoo!ニュースのRSSフィード（複数可）から最新のニュース記事を最大count件取得します。
+    フィードの取得はスレッドで並行して行い、複数フィードの記事は公開日時の新しい順に並べ、
+    同じURLの記事は1件にまとめます。
+    戻り値: [{'title': '...', 'url': '...'}, ...] のリスト
+    """
+    print(f"RSSフィードを{len(rss_urls)}件取得中 (最新{count}件)")
+    cached_feeds = {rss_url: get_cached_feed(cache_conn, rss_url) for rss_url in rss_urls}
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda u: fetch_feed(u, cached_feeds[u]), rss_urls))
+
+    entries = []
+    for rss_url, (feed, validators) in zip(rss_urls, results):
+        if validators:
+            save_cached_feed(cache_conn, rss_url, *validators)
+        if feed is not None:
+            entries.extend(feed.entries)
+
+    if not entries:
+        print("エラー: RSSフィードから記事が見つかりませんでした。")
         return []
 
+    # 複数フィードの場合だけ公開日時順に並べ替える（1フィードならフィード内の掲載順を保つ）
+    if len(rss_urls) > 1:
+        entries.sort(key=lambda e: e.get('published_parsed') or time.gmtime(0), reverse=True)
+
+    # 最新の記事から指定件数（count）分を、URLの重複を除いて取得
+    news_list = []
+    seen_urls = set()
+    for entry in entries:
+        if len(news_list) >= count:
+            break
+        title = entry.get('title')
+        link = entry.get('link')
+        # タイトルやURLのない項目は記事として扱えないため読み飛ばす
+        if not title or not link or link in seen_urls:
+            continue
+        seen_urls.add(link)
+        news_list.append({
+            'title': title,
+            'url': link
+        })
+        print(f"記事取得: {title}")
+
+    return news_list
+
 # ------------------------------------------------------------------------------
-# 関数2: ニュース記事の本文をスクレイピングする (変更なし)
+# 関数2: ニュース記事の本文をスクレイピングする (修正点: lxmlで受信しながら逐次解析)
 # ------------------------------------------------------------------------------
-def scrape_article_body(url):
+def _is_article_paragraph(elem):
+    """
+    Yahoo!ニュースの本文パラグラフかどうかを判定します。
+    （classに「sc-」「article_body」を含むp、またはdiv.article_body内のp）
+    """
+    cls = elem.get('class', '')
+    if 'sc-' in cls or 'article_body' in cls:
+        return True
+    return any(
+        parent.tag == 'div' and 'article_body' in parent.get('class', '').split()
+        for parent in elem.iterancestors()
+    )
+
+async def scrape_article_body(session, url, cached=None):
     """
-    指定されたURLからHTMLを取得し、BeautifulSoupで記事本文を抽出します。
-    （前回のコードと同じロジックを使用）
+    指定されたURLからaiohttpでHTMLを受信しながら、lxmlのHTMLPullParserで記事本文を抽出します。
+    本文が上限文字数（MAX_CHARS）に達した時点で受信と解析を打ち切ります。
+    複数記事をasyncio.gatherで同時に取得できるよう、共有のセッションを受け取ります。
+    前回の (ETag, Last-Modified, 本文) がcachedにあれば条件付きGETを行い、304なら前回の本文を返します。
+    戻り値: (記事本文, ETag, Last-Modified) のタプル（失敗した場合は (None, None, None)）
     """
     print(f"記事本文をスクレイピング中: {url}")
+    headers = {}
+    if cached:
+        etag, last_modified, _ = cached
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
+        async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=10)) as response:
+            if response.status == 304 and cached:
+                print(f"記事に更新がないため、前回取得した本文を使用します: {url}")
+                return cached[2], cached[0], cached[1]
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Yahoo!ニュースの本文を特定するためのセレクタを試行
-        paragraphs = soup.find_all('p', class_=lambda x: x and ('sc-' in x or 'article_body' in x))
-        
-        if not paragraphs:
-            article_body_div = soup.find('div', class_='article_body') 
-            if article_body_div:
-                 paragraphs = article_body_div.find_all('p')
+            response.raise_for_status()
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+
+            parser = etree.HTMLPullParser(events=('end',), encoding=response.charset)
+            paragraphs = []
+            total_chars = 0
+            size = 0
+            # 受信したチャンクを順にパーサーへ渡し、閉じたpタグから本文を集める
+            async for chunk in response.content.iter_chunked(8192):
+                parser.feed(chunk)
+                size += len(chunk)
+                for _, elem in parser.read_events():
+                    if elem.tag == 'p' and _is_article_paragraph(elem):
+                        text = "".join(t.strip() for t in elem.itertext())
+                        if text:
+                            paragraphs.append(text)
+                            total_chars += len(text) + 1
+                # 本文が十分集まったか、HTMLの読み込み上限に達したら残りはダウンロードしない
+                if total_chars > MAX_CHARS or size >= MAX_HTML_BYTES:
+                    response.close()
+                    break
+            root = parser.close()
 
         if not paragraphs:
             print("警告: 記事本文のパラグラフが見つかりませんでした。HTML全体からテキストを抽出します。")
-            main_content = soup.find('main')
-            return main_content.get_text(separator='\n', strip=True) if main_content else soup.get_text(separator='\n', strip=True)
-
-        article_text = "\n".join([p.get_text(strip=True) for p in paragraphs if p.get_text(strip=True)])
+            main_content = root.find('.//main')
+            target = main_content if main_content is not None else root
+            # スクリプトやスタイルの中身は本文ではないため取り除く
+            etree.strip_elements(target, 'script', 'style', 'noscript', with_tail=False)
+            # テキストノードごとに1行にまとめる（BeautifulSoupのget_text(separator='\n', strip=True)と同じ結果）
+            article_text = "\n".join(t.strip() for t in target.itertext() if t.strip())
+        else:
+            article_text = "\n".join(paragraphs)
         
         # GPT APIの入力制限を考慮し、長すぎる場合はカット
-        MAX_CHARS = 3000
         if len(article_text) > MAX_CHARS:
             article_text = article_text[:MAX_CHARS] + "..."
             
-        return article_text
+        return article_text, etag, last_modified
 
-    except requests.exceptions.RequestException as req_err:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as req_err:
         print(f"HTTPリクエスト中にエラーが発生しました: {req_err}")
-        return None
+        return None, None, None
     except Exception as e:
         print(f"スクレイピング中に予期せぬエラーが発生しました: {e}")
-        return None
+        return None, None, None
 
 # ------------------------------------------------------------------------------
-# 関数3: OpenAI GPT APIで要約とフリガナ・単語解説を生成する (修正点)
+# 要約リクエストのプロンプト（固定の指示文はここで1回だけ定義し、記事ごとの値だけを埋め込む）
 # ------------------------------------------------------------------------------
-def summarize_and_add_furigana(title, article_text):
-    """
-    記事のタイトルと本文をGPT APIに送り、要約、フリガナ、単語解説を生成します。
-    """
-    if not article_text:
-        return "記事本文が見つからなかったため、要約できませんでした。"
+ARTICLE_TEMPLATE = """
+    ### 記事{index}
+    【記事タイトル】
+    {title}
     
-    print("GPT APIに要約とフリガナ・単語解説をリクエスト中...")
+    【記事本文】
+    {article_text}
+    """
 
-    # プロンプト（AIへの指示）の作成を修正
-    prompt = f"""
-    以下のニュース記事のタイトルと本文を読み、以下の要件を満たすテキストを生成してください。
+PROMPT_TEMPLATE = """
+    以下の{count}件のニュース記事のタイトルと本文を読み、記事ごとに以下の要件を満たすテキストを生成してください。
     
     【要件】
     1. 記事の内容を**3行以内**で、分かりやすく**要約**してください。
     2. 要約文の中で、**難しい漢字、専門用語、人名、地名**にのみ、括弧書きで**フリガナ**を付けてください。全ての漢字にフリガナを付ける必要はありません。
-    3. 記事本文に含まれる**難しい専門用語**や**馴染みの薄い単語**があれば、その**意味を簡潔に**一行で補足してください（補足がない場合は[単語解説]セクション自体を省略してください）。
+    3. 記事本文に含まれる**難しい専門用語**や**馴染みの薄い単語**があれば、その**意味を簡潔に**一行で補足してください（補足がない場合はglossaryを空のリストにしてください）。
+    4. 結果は記事番号の順に、以下のJSON形式のみで出力してください。
     
-    【出力フォーマット】
-    [要約]
-    要約テキスト1行目（フリガナを適切に付与）
-    要約テキスト2行目
-    要約テキスト3行目
-    
-    [単語解説]
-    （補足が必要な場合のみ記載）単語: 意味
+    【出力フォーマット（JSON）】
+    {{"articles": [
+      {{"id": 記事番号,
+        "summary": ["要約テキスト1行目（フリガナを適切に付与）", "要約テキスト2行目", "要約テキスト3行目"],
+        "glossary": ["単語: 意味"]}}
+    ]}}
     
     ---
-    
-    【記事タイトル】
-    {title}
-    
-    【記事本文】
-    {article_text}
+    {articles_text}
+    """
+
+def _as_lines(value):
     """
+    JSONの値を行のリストにします。文字列は1行として扱い、文字列のリスト以外はTypeErrorにします。
+    """
+    if isinstance(value, str):
+        return [value] if value.strip() else []
+    if isinstance(value, list) and all(isinstance(line, str) for line in value):
+        return [line for line in value if line.strip()]
+    raise TypeError(f"文字列またはそのリストではありません: {value!r}")
+
+# ------------------------------------------------------------------------------
+# 関数3: OpenAI GPT APIで要約とフリガナ・単語解説を生成する (修正点: 全記事を1回のリクエストにまとめ、JSONで受け取る)
+# ------------------------------------------------------------------------------
+async def summarize_and_add_furigana(articles):
+    """
+    複数記事のタイトルと本文を1回のGPT APIリクエストにまとめて送り、
+    記事ごとの要約、フリガナ、単語解説を生成します。
+    引数: [(タイトル, 本文), ...] のリスト
+    戻り値: 引数と同じ順序の要約テキストのリスト（生成に失敗した記事はNone）
+    """
+    if not articles:
+        return []
+    
+    print(f"GPT APIに{len(articles)}記事分の要約とフリガナ・単語解説をまとめてリクエスト中...")
+
+    # 記事ごとに番号を振って1つのプロンプトに並べる
+    articles_text = "\n".join(
+        ARTICLE_TEMPLATE.format(index=i, title=title, article_text=article_text)
+        for i, (title, article_text) in enumerate(articles, start=1)
+    )
+    prompt = PROMPT_TEMPLATE.format(count=len(articles), articles_text=articles_text)
 
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo", # コスト効率と速度を考慮
+        response = await create_chat_completion(
+            model="gpt-4o-mini", # コスト効率と速度を考慮
             messages=[
                 {"role": "system", "content": "あなたはプロのニュースキャスターです。情報を正確かつ簡潔に、親しみやすい言葉で伝えてください。フリガナは難しい単語のみに絞ってください。"},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.3 # 安定した要約を生成
+            temperature=0.3, # 安定した要約を生成
+            max_tokens=MAX_TOKENS_PER_ARTICLE * len(articles), # 要約の長さに合わせて生成量を制限
+            response_format={"type": "json_object"} # 記事ごとの結果を確実に読み取るためJSONで受け取る
         )
         
-        generated_text = response.choices[0].message.content.strip()
+        result = json.loads(response.choices[0].message.content)
         print("GPT APIレスポンスを取得しました。")
-        return generated_text
 
     except Exception as e:
         print(f"OpenAI API呼び出し中にエラーが発生しました: {e}")
-        return f"要約生成中にエラーが発生しました。\nエラー内容: {e}"
+        return [None] * len(articles)
+
+    # 記事番号ごとに、LINEで表示する[要約]・[単語解説]のテキストへ整形する
+    summaries = {}
+    items = result.get("articles") if isinstance(result, dict) else None
+    if not isinstance(items, list):
+        print(f"警告: 要約結果の形式が不正です: {result}")
+        items = []
+    for item in items:
+        try:
+            summary_lines = _as_lines(item["summary"])
+            glossary_lines = _as_lines(item.get("glossary") or [])
+            if not summary_lines:
+                raise ValueError("summaryが空です")
+            text = "[要約]\n" + "\n".join(summary_lines)
+            if glossary_lines:
+                text += "\n\n[単語解説]\n" + "\n".join(glossary_lines)
+            summaries[int(item["id"])] = text
+        except (KeyError, TypeError, ValueError):
+            print(f"警告: 要約結果の形式が不正です: {item}")
+
+    return [summaries.get(i) for i in range(1, len(articles) + 1)]
 
 # ------------------------------------------------------------------------------
 # 関数4: LINE Messaging APIでメッセージを送信する (変更なし)
@@ -199,7 +411,7 @@ def send_line_message(user_id, message, token):
     }
 
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = SESSION.post(url, headers=headers, json=data)
         response.raise_for_status() 
         
         print("LINEメッセージ送信成功！")
@@ -209,22 +421,229 @@ def send_line_message(user_id, message, token):
         print(f"LINEメッセージ送信中にエラーが発生しました: {req_err}")
         return False
 
+# ------------------------------------------------------------------------------
+# 関数5: 記事URLをキーに要約を、フィードURLをキーにRSSをSQLiteへキャッシュする (追加)
+# ------------------------------------------------------------------------------
+def open_cache(db_path=CACHE_DB_PATH):
+    """
+    要約キャッシュのSQLiteデータベースを開き、必要に応じてテーブルを作成します。
+    保持期間（CACHE_TTL_DAYS）を過ぎた古い行はここで削除します。
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS cache ("
+        "url_hash TEXT PRIMARY KEY, title TEXT, summary TEXT, ts INTEGER, "
+        "etag TEXT, last_modified TEXT, body TEXT)"
+    )
+    # 条件付きGET用の列がない古いキャッシュには列を追加する
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(cache)")}
+    for column in ("etag", "last_modified", "body"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE cache ADD COLUMN {column} TEXT")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS semantic_cache ("
+        "url_hash TEXT PRIMARY KEY, embedding BLOB, summary TEXT, ts INTEGER, model TEXT)"
+    )
+    # 埋め込みモデル名の列がない古いキャッシュには列を追加する（既存の行はモデル不明として照合しない）
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(semantic_cache)")}
+    if "model" not in columns:
+        conn.execute("ALTER TABLE semantic_cache ADD COLUMN model TEXT")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS feeds ("
+        "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, body BLOB, ts INTEGER)"
+    )
+    expire_ts = int(time.time()) - CACHE_TTL_DAYS * 86400
+    conn.execute("DELETE FROM cache WHERE ts < ?", (expire_ts,))
+    conn.execute("DELETE FROM semantic_cache WHERE ts < ?", (expire_ts,))
+    conn.execute("DELETE FROM feeds WHERE ts < ?", (expire_ts,))
+    conn.commit()
+    return conn
+
+def _url_hash(url):
+    return hashlib.sha1(url.encode()).hexdigest()
+
+def get_cached_summary(conn, url):
+    """
+    キャッシュ済みの要約を返します。未登録の場合はNoneを返します。
+    """
+    row = conn.execute("SELECT summary FROM cache WHERE url_hash=?", (_url_hash(url),)).fetchone()
+    return row[0] if row else None
+
+def save_summary(conn, url, title, summary):
+    """
+    生成した要約をキャッシュに保存します。（保存済みの本文と条件付きGET用ヘッダーは残します）
+    """
+    conn.execute(
+        "INSERT INTO cache (url_hash, title, summary, ts) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(url_hash) DO UPDATE SET "
+        "title=excluded.title, summary=excluded.summary, ts=excluded.ts",
+        (_url_hash(url), title, summary, int(time.time()))
+    )
+    conn.commit()
+
+def get_cached_article(conn, url):
+    """
+    前回取得した記事本文の (ETag, Last-Modified, 本文) を返します。未取得の場合はNoneを返します。
+    """
+    return conn.execute(
+        "SELECT etag, last_modified, body FROM cache WHERE url_hash=? AND body IS NOT NULL",
+        (_url_hash(url),)
+    ).fetchone()
+
+def save_article_body(conn, url, title, etag, last_modified, body):
+    """
+    抽出した記事本文を、次回の条件付きGET用のヘッダーと合わせて保存します。（保存済みの要約は残します）
+    """
+    conn.execute(
+        "INSERT INTO cache (url_hash, title, ts, etag, last_modified, body) VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(url_hash) DO UPDATE SET "
+        "title=excluded.title, ts=excluded.ts, etag=excluded.etag, "
+        "last_modified=excluded.last_modified, body=excluded.body",
+        (_url_hash(url), title, int(time.time()), etag, last_modified, body)
+    )
+    conn.commit()
+
+def get_cached_feed(conn, url):
+    """
+    前回取得したRSSフィードの (ETag, Last-Modified, 本文) を返します。未取得の場合はNoneを返します。
+    """
+    return conn.execute("SELECT etag, last_modified, body FROM feeds WHERE url=?", (url,)).fetchone()
+
+def save_cached_feed(conn, url, etag, last_modified, body):
+    """
+    取得したRSSフィードを、次回の条件付きGET用のヘッダーと合わせて保存します。
+    """
+    conn.execute(
+        "INSERT OR REPLACE INTO feeds (url, etag, last_modified, body, ts) VALUES (?, ?, ?, ?, ?)",
+        (url, etag, last_modified, body, int(time.time()))
+    )
+    conn.commit()
+
+# ------------------------------------------------------------------------------
+# 関数6: タイトルの埋め込みで、言い回しの異なる同一ニュースの要約を再利用する (追加)
+# ------------------------------------------------------------------------------
+async def embed_titles(titles):
+    """
+    記事タイトルの埋め込みベクトルを1回のAPIリクエストでまとめて取得します。
+    戻り値: (タイトル数, 次元数) のNumPy配列（取得に失敗した場合はNone）
+    """
+    if not titles:
+        return None
+
+    try:
+        response = await create_embeddings(model=EMBEDDING_MODEL, input=titles)
+        return np.array([item.embedding for item in response.data], dtype=np.float32)
+
+    except Exception as e:
+        print(f"埋め込みの取得中にエラーが発生しました: {e}")
+        return None
+
+def find_similar_summaries(conn, embeddings):
+    """
+    保存済みのタイトル埋め込みとコサイン類似度を計算し、
+    しきい値（SEMANTIC_CACHE_THRESHOLD）を超えるものがあればその要約を返します。
+    戻り値: embeddingsの各行に対応する要約のリスト（該当なしはNone）
+    """
+    no_hits = [None] * len(embeddings)
+    try:
+        # 同じモデル・同じ次元数で作られた埋め込みだけを比較対象にする
+        rows = conn.execute(
+            "SELECT embedding, summary FROM semantic_cache WHERE model=?", (EMBEDDING_MODEL,)
+        ).fetchall()
+        vectors = [np.frombuffer(row[0], dtype=np.float32) for row in rows]
+        matched = [(vector, row[1]) for vector, row in zip(vectors, rows) if len(vector) == embeddings.shape[1]]
+        if not matched:
+            return no_hits
+
+        stored = np.stack([vector for vector, _ in matched])
+        sims = (stored @ embeddings.T) / (
+            np.linalg.norm(stored, axis=1)[:, None] * np.linalg.norm(embeddings, axis=1)[None, :]
+        )
+        best = sims.argmax(axis=0)
+        return [
+            matched[j][1] if sims[j, i] > SEMANTIC_CACHE_THRESHOLD else None
+            for i, j in enumerate(best)
+        ]
+
+    except Exception as e:
+        # 類似度の計算に失敗しても処理は止めず、類似記事なしとして扱う
+        print(f"類似記事の検索中にエラーが発生しました: {e}")
+        return no_hits
+
+def save_semantic_entry(conn, url, embedding, summary):
+    """
+    タイトルの埋め込みと要約の組を、埋め込みモデル名と合わせてキャッシュに保存します。
+    """
+    conn.execute(
+        "INSERT OR REPLACE INTO semantic_cache (url_hash, embedding, summary, ts, model) VALUES (?, ?, ?, ?, ?)",
+        (_url_hash(url), embedding.astype(np.float32).tobytes(), summary, int(time.time()), EMBEDDING_MODEL)
+    )
+    conn.commit()
+
 # ------------------------------------------------------------------------------
 # メイン処理 (プログラムの実行開始地点) (修正点)
 # ------------------------------------------------------------------------------
-def main():
+async def main():
     """
-    全体の処理フローを定義します。（3記事分のループ処理を追加）
+    全体の処理フローを定義します。（キャッシュにない記事だけ本文を並行して取得し、要約は1回のリクエストで生成）
     """
     print(f"--- 処理開始: {datetime.now()} ---")
     
     # 1. RSSからニュース情報を3件取得
-    news_list = get_latest_news_from_rss(YAHOO_RSS_URL, count=3)
+    cache_conn = open_cache()
+    news_list = get_latest_news_from_rss(YAHOO_RSS_URLS, cache_conn, count=3)
     
     if not news_list:
+        cache_conn.close()
         send_line_message(LINE_USER_ID, "今朝のニュースを取得できませんでした。", LINE_CHANNEL_ACCESS_TOKEN)
         return
 
+    # 2. キャッシュ済みの記事は、スクレイピングと要約をどちらも省略する
+    summaries = {news['url']: get_cached_summary(cache_conn, news['url']) for news in news_list}
+    pending = [news for news in news_list if summaries[news['url']] is None]
+
+    # URLが異なっても、タイトルの意味が近い記事はキャッシュ済みの要約を再利用する
+    embeddings = await embed_titles([news['title'] for news in pending])
+    title_embeddings = {}
+    if embeddings is not None:
+        similar = find_similar_summaries(cache_conn, embeddings)
+        for news, embedding, summary in zip(pending, embeddings, similar):
+            title_embeddings[news['url']] = embedding
+            if summary:
+                print(f"類似記事の要約を再利用: {news['title']}")
+                summaries[news['url']] = summary
+                save_summary(cache_conn, news['url'], news['title'], summary)
+        pending = [news for news in pending if summaries[news['url']] is None]
+    print(f"キャッシュ済み: {len(news_list) - len(pending)}件 / 新規処理: {len(pending)}件")
+
+    # 3. 未処理の記事の本文を並行してスクレイピング（待ち時間は最も遅い1件分で済む）
+    connector = aiohttp.TCPConnector(limit=20)
+    #    前回本文を取得済みの記事は条件付きGETにして、更新がなければ本文の再取得と解析を省略する
+    async with aiohttp.ClientSession(connector=connector, headers=HTTP_HEADERS) as session:
+        scraped = await asyncio.gather(
+            *[scrape_article_body(session, news['url'], get_cached_article(cache_conn, news['url']))
+              for news in pending]
+        )
+    article_texts = {}
+    for news, (text, etag, last_modified) in zip(pending, scraped):
+        # 空白だけの本文も取得失敗として扱い、GPT APIには送らない
+        article_texts[news['url']] = (text or "").strip()
+        if article_texts[news['url']]:
+            save_article_body(cache_conn, news['url'], news['title'], etag, last_modified, article_texts[news['url']])
+
+    # 4. 本文を取得できた記事だけをまとめて、1回のGPT APIリクエストで要約を生成
+    targets = [news for news in pending if article_texts[news['url']]]
+    generated = await summarize_and_add_furigana(
+        [(news['title'], article_texts[news['url']]) for news in targets]
+    )
+    for news, summary in zip(targets, generated):
+        summaries[news['url']] = summary
+        if summary:
+            save_summary(cache_conn, news['url'], news['title'], summary)
+            if news['url'] in title_embeddings:
+                save_semantic_entry(cache_conn, news['url'], title_embeddings[news['url']], summary)
+    cache_conn.close()
+
     # 記事ごとの処理結果を格納するリスト
     all_summaries = []
     
@@ -233,39 +652,32 @@ def main():
         title = news['title']
         url = news['url']
         
-        print(f"\n--- 記事 {i+1}/{len(news_list)} の処理開始 ---")
-
-        # 2. 記事の本文をスクレイピング
-        article_text = scrape_article_body(url)
-        
-        # 記事ごとのメッセージを構成
-        article_summary_block = f"📰 **記事 {i+1}**：{title}\n"
+        print(f"\n--- 記事 {i+1}/{len(news_list)} のメッセージを作成 ---")
         
-        if not article_text:
+        # 記事本文の部分を先に決める
+        if summaries[url]:
+            # GPT APIで生成した（またはキャッシュ済みの）要約とフリガナ・単語解説
+            body_piece = summaries[url]
+        elif not article_texts.get(url):
             # スクレイピング失敗時の処理
-            article_summary_block += f"[エラー] 本文取得失敗。URLをご確認ください。\n"
+            body_piece = "[エラー] 本文取得失敗。URLをご確認ください。\n"
         else:
-            # 3. GPT APIで要約とフリガナ・単語解説を生成
-            summary_text_raw = summarize_and_add_furigana(title, article_text)
-            article_summary_block += summary_text_raw
+            # 要約生成失敗時の処理
+            body_piece = "[エラー] 要約生成失敗。\n"
 
-        article_summary_block += f"\n🔗 記事URL: {url}"
+        # 記事ごとのメッセージを1回で組み立てる
+        article_summary_block = f"📰 **記事 {i+1}**：{title}\n{body_piece}\n🔗 記事URL: {url}"
         
         all_summaries.append(article_summary_block)
-        
-        # 連続API呼び出しを避けるため、次の記事処理前に少し待つ
-        if i < len(news_list) - 1:
-            time.sleep(1) # 1秒待機
     
-    # 4. 3記事分の情報をまとめてLINEでメッセージを送信
-    # 3つの記事ブロックを改行と区切り線で結合
-    all_summaries_joined = '\n\n----------------------------------\n\n'.join(all_summaries)
-    final_message = (
-        f"🌞 今朝の厳選ニュース {len(news_list)}本 🗞️\n"
-        f"==================================\n\n"
-        f"{all_summaries_joined}" # 事前に結合した変数を挿入
-        f"\n\n=================================="
-    )
+    # 5. 3記事分の情報をまとめてLINEでメッセージを送信
+    # 見出し・記事ブロック（改行と区切り線で結合）・締めの線を、1回のjoinでまとめる
+    final_message = "".join([
+        f"🌞 今朝の厳選ニュース {len(news_list)}本 🗞️\n",
+        "==================================\n\n",
+        '\n\n----------------------------------\n\n'.join(all_summaries),
+        "\n\n==================================",
+    ])
     
     # LINEのメッセージ最大文字数（5000字）のチェック
     if len(final_message) > 4800:
@@ -276,4 +688,7 @@ def main():
     print(f"--- 処理完了: {datetime.now()} ---")
 
 if __name__ == "__main__":
-    main()
+    try:
+        asyncio.run(main())
+    finally:
+        SESSION.close()